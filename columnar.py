@@ -0,0 +1,139 @@
+"""Compact columnar snapshot format for AgriConnect entries.
+
+Only uses the standard library, so analysts can read snapshots without
+FastAPI or access to the live users.db.
+
+File layout:
+    MAGIC (8 bytes) | header length (uint64, little endian) | JSON header
+    | column blocks, each aligned to 8 bytes
+
+The header lists every column's name, array typecode, byte length and
+byte offset (relative to the end of the header), plus the dictionaries
+for dictionary-encoded columns (stored as int32 codes). Missing floats
+are stored as NaN.
+"""
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+import tempfile
+
+MAGIC = b'AGCOL1\0\0'
+ALIGN = 8
+
+def _padding(position):
+    return -position % ALIGN
+
+def write_snapshot(path, columns, dictionaries=None):
+    """Write columns (a list of (name, array.array) pairs) to path atomically."""
+    lengths = {len(values) for _, values in columns}
+    if len(lengths) > 1:
+        raise ValueError('All columns must have the same number of rows.')
+    header = {
+        "rows": lengths.pop() if lengths else 0,
+        "byteorder": sys.byteorder,
+        "columns": [],
+        "dictionaries": dictionaries or {},
+    }
+    position = 0
+    for name, values in columns:
+        size = len(values) * values.itemsize
+        header["columns"].append({"name": name, "type": values.typecode, "offset": position, "length": size})
+        position += size + _padding(size)
+    encoded = json.dumps(header).encode('utf-8')
+    encoded += b' ' * _padding(len(MAGIC) + 8 + len(encoded))
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    # A unique temp file per writer, so overlapping snapshot runs never
+    # interleave; the last one to finish wins.
+    handle, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(handle, 'wb') as f:
+            f.write(MAGIC)
+            f.write(struct.pack('<Q', len(encoded)))
+            f.write(encoded)
+            for _, values in columns:
+                values.tofile(f)
+                f.write(b'\0' * _padding(len(values) * values.itemsize))
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+class Snapshot:
+    """Memory-mapped, read-only view of a snapshot file.
+
+    column() returns a typed memoryview straight over the mapped file, so
+    scans never copy the data. Release those views before close().
+    """
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        self._map = None
+        try:
+            self._read_header(path)
+        except BaseException:
+            self.close()
+            raise
+
+    def _read_header(self, path):
+        start = len(MAGIC) + 8
+        # mmap refuses empty files, so check the size before mapping
+        if os.fstat(self._file.fileno()).st_size < start:
+            raise ValueError(f'{path} is not an AgriConnect snapshot.')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f'{path} is not an AgriConnect snapshot.')
+        (header_length,) = struct.unpack_from('<Q', self._map, len(MAGIC))
+        self._data_start = start + header_length
+        if self._data_start > len(self._map):
+            raise ValueError(f'{path} is truncated.')
+        header = json.loads(self._map[start:self._data_start])
+        if header["byteorder"] != sys.byteorder:
+            raise ValueError(f'{path} was written on a {header["byteorder"]}-endian machine.')
+        self.rows = header["rows"]
+        self.dictionaries = header["dictionaries"]
+        self._columns = {column["name"]: column for column in header["columns"]}
+        end = max((column["offset"] + column["length"] for column in header["columns"]), default=0)
+        if self._data_start + end > len(self._map):
+            raise ValueError(f'{path} is truncated.')
+
+    @property
+    def column_names(self):
+        return list(self._columns)
+
+    def column(self, name):
+        column = self._columns[name]
+        offset = self._data_start + column["offset"]
+        view = memoryview(self._map)[offset:offset + column["length"]]
+        return view.cast(column["type"])
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def sum_by(snapshot, key, value):
+    """Total a numeric column per label of a dictionary-encoded column."""
+    labels = snapshot.dictionaries[key]
+    totals = [0] * len(labels)
+    codes = snapshot.column(key)
+    values = snapshot.column(value)
+    try:
+        for code, amount in zip(codes, values):
+            if not math.isnan(amount):
+                totals[code] += amount
+    finally:
+        codes.release()
+        values.release()
+    return dict(zip(labels, totals))
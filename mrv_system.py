@@ -1,14 +1,90 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import random
+import socket
+import tempfile
 import sqlite3
 import hashlib
-from fastapi import FastAPI, Request, Form, Response
+import threading
+import time
+from array import array
+from datetime import date, datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager, contextmanager
+from fastapi import FastAPI, HTTPException, Query, Request, Form, Response
 from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
 
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+import columnar
+import photos
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to SQLite's own locking
+    fcntl = None
+
 # --- Database Setup ---
+# All workers share one SQLite file. Set AGRICONNECT_DB to point them elsewhere.
+DB_PATH = os.environ.get('AGRICONNECT_DB', 'users.db')
+WRITE_LOCK_PATH = DB_PATH + '.writelock'
+BUSY_TIMEOUT_MS = 5000
+
+def get_connection():
+    conn = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT_MS / 1000)
+    conn.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+    conn.execute('PRAGMA synchronous = NORMAL')
+    return conn
+
+# Serializes writers within this process; the flock below does the same
+# across uvicorn/gunicorn workers.
+_write_lock = threading.Lock()
+
+@contextmanager
+def writer_slot():
+    """Hold the single database write slot.
+
+    Only one writer (across threads and worker processes) is active at a
+    time, so concurrent workers queue here instead of failing with
+    "database is locked".
+    """
+    with _write_lock:
+        with open(WRITE_LOCK_PATH, 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+@contextmanager
+def write_transaction():
+    """Yield a connection in a write transaction holding the writer slot.
+
+    Commits on exit, rolls back on error.
+    """
+    with writer_slot():
+        conn = get_connection()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
 # This function is executed once when the application starts up
 def setup_database():
-    conn = sqlite3.connect('users.db')
+    conn = get_connection()
     cursor = conn.cursor()
+    # WAL lets readers in every worker proceed while the single writer commits
+    cursor.execute('PRAGMA journal_mode = WAL')
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS users (
             id INTEGER PRIMARY KEY,
@@ -16,13 +92,909 @@ def setup_database():
             password TEXT NOT NULL
         )
     ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS cache_generations (
+            namespace TEXT PRIMARY KEY,
+            generation INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
     conn.commit()
     conn.close()
 
 # Call the setup function immediately
 setup_database()
 
-app = FastAPI()
+# --- Shared Cache ---
+# Each worker keeps its own in-memory caches. To keep them coherent, writers
+# bump a per-namespace generation in cache_generations inside their write
+# transaction. Readers poll PRAGMA data_version (which changes whenever any
+# other connection commits) and only re-read the generations when it moves.
+_coherence_lock = threading.Lock()
+_coherence_conn = None
+_data_version = None
+_caches = {}
+
+def _sync_caches():
+    global _coherence_conn, _data_version
+    with _coherence_lock:
+        if _coherence_conn is None:
+            _coherence_conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+        version = _coherence_conn.execute('PRAGMA data_version').fetchone()[0]
+        if version == _data_version:
+            return
+        _data_version = version
+        generations = dict(_coherence_conn.execute(
+            'SELECT namespace, generation FROM cache_generations'
+        ).fetchall())
+        for namespace, cache in list(_caches.items()):
+            cache._check_generation(generations.get(namespace, 0))
+
+class SharedCache:
+    """Per-worker key/value cache invalidated across all workers.
+
+    Call invalidate(conn) with the connection from write_transaction() so
+    the generation bump commits together with the data change.
+
+    _generation is a local counter bumped on every clear; a load only
+    stores its result if no clear happened while it ran, so a value read
+    before an invalidation can never outlive it. _seen_generation is the
+    last generation read from cache_generations.
+    """
+
+    def __init__(self, namespace, ttl=300, max_entries=1024):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._generation = 0
+        self._seen_generation = None
+        _caches[namespace] = self
+
+    def _clear(self):
+        self._entries.clear()
+        self._generation += 1
+
+    def _check_generation(self, generation):
+        with self._lock:
+            if generation != self._seen_generation:
+                self._clear()
+                self._seen_generation = generation
+
+    def get(self, key, loader):
+        _sync_caches()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                return entry[1]
+            generation = self._generation
+        value = loader()
+        with self._lock:
+            if generation != self._generation:
+                return value
+            if len(self._entries) >= self.max_entries:
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[key] = (now + self.ttl, value)
+        return value
+
+    def invalidate(self, conn):
+        conn.execute(
+            'INSERT INTO cache_generations (namespace, generation) VALUES (?, 1) '
+            'ON CONFLICT(namespace) DO UPDATE SET generation = generation + 1',
+            (self.namespace,)
+        )
+        # _seen_generation stays behind on purpose: once this commits, the
+        # next sync sees the new generation and clears loads that ran
+        # before the commit became visible.
+        with self._lock:
+            self._clear()
+
+    def evict_expired(self):
+        now = time.monotonic()
+        with self._lock:
+            expired = [key for key, entry in self._entries.items() if entry[0] <= now]
+            for key in expired:
+                del self._entries[key]
+        return len(expired)
+
+user_cache = SharedCache('users')
+
+# --- Time-Partitioned Entries ---
+# Entries live in one table per month (entries_YYYYMM), each clustered on
+# (entry_date, crop_name) so date-range scans read contiguous pages. The
+# entry_partitions catalog lists the months; a range query only opens the
+# partitions whose month falls inside the range. Old months can be moved
+# into their own compacted file under ARCHIVE_DIR and stay queryable.
+ARCHIVE_DIR = os.path.join(os.path.dirname(os.path.abspath(DB_PATH)), 'archive')
+report_cache = SharedCache('reports')
+ENTRY_COLUMNS = ('id', 'entry_date', 'crop_name', 'sapling_count',
+                 'carbon_sequestration', 'latitude', 'longitude', 'created_at')
+
+def setup_entries(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS entries_index (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            partition TEXT NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS entry_partitions (
+            name TEXT PRIMARY KEY,
+            month TEXT UNIQUE NOT NULL,
+            archive_file TEXT
+        )
+    ''')
+
+def partition_name(month):
+    return 'entries_' + month.replace('-', '')
+
+def create_partition(conn, name):
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {name} (
+            id INTEGER NOT NULL,
+            entry_date TEXT NOT NULL,
+            crop_name TEXT NOT NULL,
+            sapling_count INTEGER NOT NULL,
+            carbon_sequestration REAL,
+            latitude REAL,
+            longitude REAL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (entry_date, crop_name, id)
+        ) WITHOUT ROWID
+    ''')
+    # The clustered key starts with entry_date; lookups by id need their own index
+    conn.execute(f'CREATE INDEX IF NOT EXISTS {name}_id ON {name} (id)')
+
+def _insert_entry(conn, crop_name, sapling_count, entry_date, carbon_sequestration=None,
+                  latitude=None, longitude=None, entry_id=None, created_at=None):
+    month = entry_date.strftime('%Y-%m')
+    name = partition_name(month)
+    row = conn.execute(
+        'SELECT archive_file FROM entry_partitions WHERE month = ?', (month,)
+    ).fetchone()
+    if row and row[0]:
+        raise ValueError(f'Entries for {month} are archived and read-only.')
+    if row is None:
+        create_partition(conn, name)
+        conn.execute('INSERT INTO entry_partitions (name, month) VALUES (?, ?)', (name, month))
+    entry_id = conn.execute(
+        'INSERT INTO entries_index (id, partition) VALUES (?, ?)', (entry_id, name)
+    ).lastrowid
+    conn.execute(
+        f'INSERT INTO {name} (id, entry_date, crop_name, sapling_count, carbon_sequestration, '
+        'latitude, longitude, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))',
+        (entry_id, entry_date.isoformat(), crop_name, sapling_count,
+         carbon_sequestration, latitude, longitude, created_at)
+    )
+    return entry_id
+
+def insert_entry(crop_name, sapling_count, entry_date=None, carbon_sequestration=None,
+                 latitude=None, longitude=None):
+    with write_transaction() as conn:
+        entry_id = _insert_entry(conn, crop_name, sapling_count, entry_date or date.today(),
+                                 carbon_sequestration, latitude, longitude)
+        report_cache.invalidate(conn)
+    return entry_id
+
+def _legacy_date(value):
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return None
+
+def migrate_farm_data(conn):
+    """Move rows from the legacy farm_data table into the entry partitions.
+
+    farm_data predates the partitions and nothing writes to it any more.
+    Rows keep their id where it is still free. The table is then renamed
+    to farm_data_legacy, which keeps the columns the partitions do not
+    carry (user_id, area_hectares, verification_status).
+    """
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'farm_data'"
+    ).fetchone()
+    if exists is None:
+        return
+    rows = conn.execute(
+        'SELECT id, crop_name, sapling_count, carbon_sequestration, latitude, longitude, '
+        'planting_date, created_at FROM farm_data ORDER BY id'
+    ).fetchall()
+    for farm_id, crop_name, sapling_count, carbon, latitude, longitude, planting_date, created_at in rows:
+        entry_date = _legacy_date(planting_date) or _legacy_date(created_at) or date.today()
+        taken = conn.execute('SELECT 1 FROM entries_index WHERE id = ?', (farm_id,)).fetchone()
+        _insert_entry(conn, crop_name, sapling_count or 0, entry_date, carbon, latitude, longitude,
+                      entry_id=None if taken else farm_id, created_at=created_at)
+    conn.execute('ALTER TABLE farm_data RENAME TO farm_data_legacy')
+    if rows:
+        report_cache.invalidate(conn)
+
+def scan_entries(start, end, columns=ENTRY_COLUMNS):
+    """Yield entry rows with start <= entry_date <= end, oldest first.
+
+    Only partitions for months inside the range are read; archived months
+    are read from their archive file.
+    """
+    select = ', '.join(columns)
+    conn = get_connection()
+    try:
+        # One read transaction so the catalog and live partitions are a
+        # consistent snapshot even if a month is archived meanwhile.
+        conn.execute('BEGIN')
+        partitions = conn.execute(
+            'SELECT name, archive_file FROM entry_partitions '
+            'WHERE month BETWEEN ? AND ? ORDER BY month',
+            (start.isoformat()[:7], end.isoformat()[:7])
+        ).fetchall()
+        query = f'SELECT {select} FROM {{}} WHERE entry_date BETWEEN ? AND ? ORDER BY entry_date, crop_name'
+        bounds = (start.isoformat(), end.isoformat())
+        for name, archive_file in partitions:
+            if archive_file is None:
+                yield from conn.execute(query.format(name), bounds)
+                continue
+            archive_uri = 'file:' + os.path.join(ARCHIVE_DIR, archive_file) + '?mode=ro'
+            archive = sqlite3.connect(archive_uri, uri=True)
+            try:
+                yield from archive.execute(query.format(name), bounds)
+            finally:
+                archive.close()
+    finally:
+        conn.close()
+
+def get_entry(entry_id):
+    conn = get_connection()
+    try:
+        # One read transaction, as in scan_entries, so the month cannot be
+        # archived and dropped between the catalog lookup and the query.
+        conn.execute('BEGIN')
+        row = conn.execute(
+            'SELECT i.partition, p.archive_file FROM entries_index i '
+            'JOIN entry_partitions p ON p.name = i.partition WHERE i.id = ?', (entry_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        name, archive_file = row
+        if archive_file is not None:
+            conn.close()
+            conn = sqlite3.connect('file:' + os.path.join(ARCHIVE_DIR, archive_file) + '?mode=ro', uri=True)
+        entry = conn.execute(
+            f'SELECT {", ".join(ENTRY_COLUMNS)} FROM {name} WHERE id = ?', (entry_id,)
+        ).fetchone()
+        return dict(zip(ENTRY_COLUMNS, entry)) if entry else None
+    finally:
+        conn.close()
+
+def compact_archive(archive_file):
+    conn = sqlite3.connect(os.path.join(ARCHIVE_DIR, archive_file))
+    try:
+        conn.execute('VACUUM')
+    finally:
+        conn.close()
+
+def archive_partition(month):
+    """Move one month out of users.db into its own compacted archive file.
+
+    The archive is built and compacted from a read snapshot, so inserts
+    keep flowing meanwhile. The writer slot is only taken at the end to
+    check the month is unchanged and swap the live table for the archive.
+    """
+    name = partition_name(month)
+    archive_file = name + '.db'
+    columns = ", ".join(ENTRY_COLUMNS)
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    conn = get_connection()
+    try:
+        conn.execute('BEGIN')
+        row = conn.execute(
+            'SELECT archive_file FROM entry_partitions WHERE name = ?', (name,)
+        ).fetchone()
+        if row is None or row[0] is not None:
+            return False
+        handle, staged_path = tempfile.mkstemp(dir=ARCHIVE_DIR, prefix=name + '.', suffix='.tmp')
+        os.close(handle)
+        archive = sqlite3.connect(staged_path)
+        try:
+            create_partition(archive, name)
+            archive.executemany(
+                f'INSERT INTO {name} ({columns}) VALUES ({", ".join("?" * len(ENTRY_COLUMNS))})',
+                conn.execute(f'SELECT {columns} FROM {name}')
+            )
+            archive.commit()
+            (copied,) = archive.execute(f'SELECT COUNT(*) FROM {name}').fetchone()
+        finally:
+            archive.close()
+    finally:
+        conn.close()
+
+    try:
+        compact_archive(os.path.basename(staged_path))
+        with write_transaction() as conn:
+            row = conn.execute(
+                'SELECT archive_file FROM entry_partitions WHERE name = ?', (name,)
+            ).fetchone()
+            (live,) = conn.execute(f'SELECT COUNT(*) FROM {name}').fetchone()
+            # Entries are never updated or deleted, so an unchanged count
+            # means the archive still holds the whole month. Otherwise give up
+            # and let the next run try again.
+            if row is None or row[0] is not None or live != copied:
+                return False
+            os.replace(staged_path, os.path.join(ARCHIVE_DIR, archive_file))
+            conn.execute('UPDATE entry_partitions SET archive_file = ? WHERE name = ?', (archive_file, name))
+            conn.execute(f'DROP TABLE {name}')
+            report_cache.invalidate(conn)
+        return True
+    finally:
+        if os.path.exists(staged_path):
+            os.remove(staged_path)
+
+def archive_old_partitions(keep_months=12):
+    today = date.today()
+    cutoff_year, cutoff_month = divmod(today.year * 12 + today.month - 1 - keep_months, 12)
+    cutoff = f'{cutoff_year:04d}-{cutoff_month + 1:02d}'
+    conn = get_connection()
+    months = [month for (month,) in conn.execute(
+        'SELECT month FROM entry_partitions WHERE archive_file IS NULL AND month < ?', (cutoff,)
+    )]
+    conn.close()
+    return [month for month in months if archive_partition(month)]
+
+def crop_report(start, end):
+    totals = {}
+    for crop_name, sapling_count, carbon in scan_entries(
+            start, end, ('crop_name', 'sapling_count', 'carbon_sequestration')):
+        total = totals.setdefault(crop_name, {"crop": crop_name, "total_saplings": 0, "total_carbon": 0.0})
+        total["total_saplings"] += sapling_count
+        total["total_carbon"] += carbon or 0.0
+    return sorted(totals.values(), key=lambda total: total["crop"])
+
+# --- Analytics Snapshots ---
+# A periodic job copies every entry (archived months included) into a
+# columnar file that analysts read with columnar.Snapshot, away from the
+# live database. entry_date is stored as days since 1970-01-01 and crop
+# names are dictionary-encoded.
+SNAPSHOT_PATH = os.path.join(os.path.dirname(os.path.abspath(DB_PATH)), 'snapshots', 'entries.agcol')
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+def write_entries_snapshot(path=SNAPSHOT_PATH):
+    ids, entry_days, crops, saplings = array('q'), array('i'), array('i'), array('q')
+    carbon, latitudes, longitudes = array('d'), array('d'), array('d')
+    crop_codes = {}
+    nan = float('nan')
+    for entry_id, entry_date, crop_name, sapling_count, carbon_sequestration, latitude, longitude in scan_entries(
+            date.min, date.max, ENTRY_COLUMNS[:-1]):
+        ids.append(entry_id)
+        entry_days.append(date.fromisoformat(entry_date).toordinal() - EPOCH_ORDINAL)
+        crops.append(crop_codes.setdefault(crop_name, len(crop_codes)))
+        saplings.append(sapling_count)
+        carbon.append(nan if carbon_sequestration is None else carbon_sequestration)
+        latitudes.append(nan if latitude is None else latitude)
+        longitudes.append(nan if longitude is None else longitude)
+    columnar.write_snapshot(path, [
+        ('id', ids),
+        ('entry_date', entry_days),
+        ('crop_name', crops),
+        ('sapling_count', saplings),
+        ('carbon_sequestration', carbon),
+        ('latitude', latitudes),
+        ('longitude', longitudes),
+    ], {'crop_name': list(crop_codes)})
+    return len(ids)
+
+# --- Field Photos ---
+# Uploads are streamed to a staging file in chunks while being hashed, so
+# a request never holds a whole photo in memory. Photos are stored once
+# per content hash; uploading the same file again only links it to the
+# entry. EXIF parsing and thumbnails are CPU-bound and run in a process
+# pool (see photos.py) so the event loop stays free. Pool processes are
+# spawned fresh rather than forked from a worker that already runs
+# threads and holds SQLite handles.
+PHOTO_DIR = os.path.join(os.path.dirname(os.path.abspath(DB_PATH)), 'uploads', 'photos')
+PHOTO_STAGING_DIR = os.path.join(PHOTO_DIR, '.staging')
+PHOTO_PROCESSES = int(os.environ.get('AGRICONNECT_PHOTO_PROCESSES', '2'))
+MAX_PHOTO_BYTES = 25 * 1024 * 1024
+PHOTO_COLUMNS = ('content_hash', 'filename', 'size', 'taken_at', 'latitude', 'longitude',
+                 'path', 'thumbnail_path')
+_photo_pool = None
+
+def setup_photos(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS photos (
+            content_hash TEXT PRIMARY KEY,
+            filename TEXT,
+            size INTEGER NOT NULL,
+            taken_at TEXT,
+            latitude REAL,
+            longitude REAL,
+            path TEXT NOT NULL,
+            thumbnail_path TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS entry_photos (
+            entry_id INTEGER NOT NULL,
+            content_hash TEXT NOT NULL,
+            PRIMARY KEY (entry_id, content_hash),
+            FOREIGN KEY (content_hash) REFERENCES photos (content_hash)
+        )
+    ''')
+
+def get_photo_pool():
+    global _photo_pool
+    if _photo_pool is None:
+        _photo_pool = ProcessPoolExecutor(
+            max_workers=PHOTO_PROCESSES, mp_context=multiprocessing.get_context('spawn')
+        )
+    return _photo_pool
+
+def discard_photo_pool(pool, wait=False):
+    global _photo_pool
+    if _photo_pool is pool:
+        _photo_pool = None
+    pool.shutdown(wait=wait)
+
+class PhotoStream:
+    """multipart/form-data callbacks that spool each file part to disk.
+
+    Every part that carries a filename becomes a staged file; other form
+    fields are ignored.
+    """
+
+    def __init__(self):
+        self.files = []
+        self.too_large = False
+        self.complete = False
+        self._headers = {}
+        self._field = b''
+        self._value = b''
+        self._current = None
+
+    def callbacks(self):
+        return {
+            'on_part_begin': self._on_part_begin,
+            'on_header_field': self._on_header_field,
+            'on_header_value': self._on_header_value,
+            'on_header_end': self._on_header_end,
+            'on_headers_finished': self._on_headers_finished,
+            'on_part_data': self._on_part_data,
+            'on_part_end': self._on_part_end,
+            'on_end': self._on_end,
+        }
+
+    def _on_part_begin(self):
+        self._headers = {}
+
+    def _on_header_field(self, data, start, end):
+        self._field += data[start:end]
+
+    def _on_header_value(self, data, start, end):
+        self._value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._field.lower()] = self._value
+        self._field = self._value = b''
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b'content-disposition', b''))
+        if b'filename' not in options:
+            return
+        os.makedirs(PHOTO_STAGING_DIR, exist_ok=True)
+        handle, staged_path = tempfile.mkstemp(dir=PHOTO_STAGING_DIR)
+        self._current = {
+            "filename": os.path.basename(options[b'filename'].decode('utf-8', 'replace')),
+            "staged_path": staged_path,
+            "size": 0,
+            "file": os.fdopen(handle, 'wb'),
+            "hash": hashlib.sha256(),
+        }
+        self.files.append(self._current)
+
+    def _on_part_data(self, data, start, end):
+        if self._current is None:
+            return
+        chunk = data[start:end]
+        self._current["size"] += len(chunk)
+        if self._current["size"] > MAX_PHOTO_BYTES:
+            self.too_large = True
+            raise ValueError(f'{self._current["filename"]} is larger than {MAX_PHOTO_BYTES} bytes.')
+        self._current["file"].write(chunk)
+        self._current["hash"].update(chunk)
+
+    def _on_part_end(self):
+        if self._current is not None:
+            self._current["file"].close()
+            self._current = None
+
+    def _on_end(self):
+        self.complete = True
+
+    def discard(self):
+        for staged in self.files:
+            staged["file"].close()
+            if os.path.exists(staged["staged_path"]):
+                os.remove(staged["staged_path"])
+
+def find_photo(content_hash):
+    conn = get_connection()
+    try:
+        row = conn.execute(
+            f'SELECT {", ".join(PHOTO_COLUMNS)} FROM photos WHERE content_hash = ?', (content_hash,)
+        ).fetchone()
+        return dict(zip(PHOTO_COLUMNS, row)) if row else None
+    finally:
+        conn.close()
+
+def save_photo(entry_id, photo):
+    with write_transaction() as conn:
+        conn.execute(
+            f'INSERT OR IGNORE INTO photos ({", ".join(PHOTO_COLUMNS)}) '
+            f'VALUES ({", ".join("?" * len(PHOTO_COLUMNS))})',
+            tuple(photo[column] for column in PHOTO_COLUMNS)
+        )
+        conn.execute('INSERT OR IGNORE INTO entry_photos (entry_id, content_hash) VALUES (?, ?)',
+                     (entry_id, photo["content_hash"]))
+
+async def store_photo(entry_id, staged):
+    content_hash = staged["hash"].hexdigest()
+    photo = await asyncio.to_thread(find_photo, content_hash)
+    duplicate = photo is not None
+    if duplicate:
+        os.remove(staged["staged_path"])
+    else:
+        loop = asyncio.get_running_loop()
+        pool = get_photo_pool()
+        try:
+            metadata = await loop.run_in_executor(
+                pool, photos.process_photo, staged["staged_path"], PHOTO_DIR, content_hash
+            )
+        except BrokenProcessPool:
+            # A pool whose worker died stays broken; start afresh next time
+            discard_photo_pool(pool)
+            raise
+        photo = {"content_hash": content_hash, "filename": staged["filename"],
+                 "size": staged["size"], **metadata}
+    await asyncio.to_thread(save_photo, entry_id, photo)
+    return {**photo, "duplicate": duplicate}
+
+# Create the entry catalog and photo tables alongside the users table
+with write_transaction() as conn:
+    setup_entries(conn)
+    # Bring live partitions up to the current create_partition schema
+    for (name,) in conn.execute('SELECT name FROM entry_partitions WHERE archive_file IS NULL').fetchall():
+        create_partition(conn, name)
+    migrate_farm_data(conn)
+    setup_photos(conn)
+
+# --- Background Scheduler ---
+# Maintenance jobs run from the FastAPI lifespan instead of request handlers.
+# Every worker runs the same scheduler. For shared jobs, the scheduler_jobs
+# table holds the next due time and a lease: a worker must win the lease
+# (a conditional UPDATE under the writer slot) before it runs the job, so
+# each run happens in exactly one worker. The owner renews the lease while
+# the job runs, so a crashed worker's lease lapses within LEASE_SECONDS.
+# Local jobs (per-worker cache upkeep) skip the lease and run in every
+# worker.
+logger = logging.getLogger(__name__)
+WORKER_ID = f'{socket.gethostname()}:{os.getpid()}'
+LEASE_SECONDS = 60
+ARCHIVE_AFTER_MONTHS = 12
+
+def setup_scheduler(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS scheduler_jobs (
+            name TEXT PRIMARY KEY,
+            next_run REAL NOT NULL,
+            lease_owner TEXT,
+            lease_expires REAL,
+            last_started REAL,
+            last_finished REAL,
+            last_status TEXT,
+            last_error TEXT,
+            last_duration REAL
+        )
+    ''')
+
+class CronSchedule:
+    """Five-field cron expression: minute hour day-of-month month day-of-week.
+
+    Fields accept *, numbers, ranges (1-5), steps (*/15, 0-30/10) and
+    comma-separated lists. Day-of-week 0 and 7 are Sunday.
+    """
+    RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f'Cron expression needs 5 fields: {expression!r}')
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            self._parse(field, low, high) for field, (low, high) in zip(fields, self.RANGES)
+        )
+        self.weekdays = {day % 7 for day in weekdays}
+        # As in cron, a restricted day-of-month and day-of-week match either.
+        self.any_day = fields[2] == '*'
+        self.any_weekday = fields[4] == '*'
+
+    @staticmethod
+    def _parse(field, low, high):
+        values = set()
+        for part in field.split(','):
+            span, _, step = part.partition('/')
+            if span == '*':
+                start, end = low, high
+            elif '-' in span:
+                start, end = (int(value) for value in span.split('-'))
+            else:
+                start = end = int(span)
+                if step:
+                    end = high
+            if not low <= start <= end <= high:
+                raise ValueError(f'Cron field {field!r} is out of range {low}-{high}')
+            values.update(range(start, end + 1, int(step) if step else 1))
+        return values
+
+    def _day_matches(self, moment):
+        day = moment.day in self.days
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_after(self, timestamp):
+        moment = datetime.fromtimestamp(timestamp).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + timedelta(days=366 * 5)
+        while moment < limit:
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1) + timedelta(days=32)).replace(day=1, hour=0, minute=0)
+            elif not self._day_matches(moment):
+                moment = (moment + timedelta(days=1)).replace(hour=0, minute=0)
+            elif moment.hour not in self.hours:
+                moment = (moment + timedelta(hours=1)).replace(minute=0)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment.timestamp()
+        raise ValueError(f'Cron expression never matches: {self.expression!r}')
+
+class Job:
+    def __init__(self, name, func, every=None, cron=None, jitter=0, max_runtime=None, shared=True):
+        if (every is None) == (cron is None):
+            raise ValueError('Give a job either every= (seconds) or cron=.')
+        self.name = name
+        self.func = func
+        self.every = every
+        self.cron = CronSchedule(cron) if cron else None
+        self.jitter = jitter
+        self.max_runtime = max_runtime
+        self.shared = shared
+        self.running = False
+        self.state = {"next_run": None, "last_started": None, "last_finished": None,
+                      "last_status": None, "last_error": None, "last_duration": None}
+
+    @property
+    def schedule(self):
+        return self.cron.expression if self.cron else f'every {self.every}s'
+
+    def next_after(self, timestamp):
+        if self.cron:
+            return self.cron.next_after(timestamp)
+        return timestamp + self.every
+
+class Scheduler:
+    def __init__(self):
+        self.jobs = {}
+        self._tasks = []
+
+    def add_job(self, name, func, **options):
+        """Register func (sync, run in a thread, or async) under a unique name."""
+        if name in self.jobs:
+            raise ValueError(f'Job {name!r} is already registered.')
+        self.jobs[name] = Job(name, func, **options)
+
+    async def start(self):
+        for job in self.jobs.values():
+            if job.shared:
+                await asyncio.to_thread(self._register_shared, job)
+            else:
+                job.state["next_run"] = job.next_after(time.time())
+            self._tasks.append(asyncio.create_task(self._run_forever(job), name=f'job:{job.name}'))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def _register_shared(self, job):
+        # Keep the earlier due time so a shortened schedule applies at once.
+        with write_transaction() as conn:
+            conn.execute(
+                'INSERT INTO scheduler_jobs (name, next_run) VALUES (?, ?) '
+                'ON CONFLICT(name) DO UPDATE SET next_run = MIN(next_run, excluded.next_run)',
+                (job.name, job.next_after(time.time()))
+            )
+
+    def _shared_next_run(self, job):
+        # While another worker holds the lease, wait for it to lapse at least.
+        conn = get_connection()
+        try:
+            next_run, lease_expires = conn.execute(
+                'SELECT next_run, lease_expires FROM scheduler_jobs WHERE name = ?', (job.name,)
+            ).fetchone()
+            return max(next_run, lease_expires or 0)
+        finally:
+            conn.close()
+
+    def _acquire(self, job):
+        now = time.time()
+        with write_transaction() as conn:
+            acquired = conn.execute(
+                'UPDATE scheduler_jobs SET next_run = ?, lease_owner = ?, lease_expires = ?, '
+                'last_started = ?, last_status = ?, last_error = NULL '
+                'WHERE name = ? AND next_run <= ? AND (lease_expires IS NULL OR lease_expires < ?)',
+                (job.next_after(now), WORKER_ID, now + LEASE_SECONDS, now, 'running', job.name, now, now)
+            ).rowcount
+        return acquired == 1
+
+    def _renew(self, job):
+        with write_transaction() as conn:
+            conn.execute(
+                'UPDATE scheduler_jobs SET lease_expires = ? WHERE name = ? AND lease_owner = ?',
+                (time.time() + LEASE_SECONDS, job.name, WORKER_ID)
+            )
+
+    async def _hold_lease(self, job):
+        # Renewing is a write, so it queues behind jobs that hold the writer
+        # slot themselves (vacuum, optimize) and their lease can lapse while
+        # they run. No other worker can start them meanwhile: _acquire needs
+        # the same slot, and next_run was moved past now when this run began.
+        while True:
+            await asyncio.sleep(LEASE_SECONDS / 3)
+            try:
+                await asyncio.to_thread(self._renew, job)
+            except Exception:
+                logger.exception('Could not renew the lease for job %s', job.name)
+
+    def _release(self, job):
+        with write_transaction() as conn:
+            conn.execute(
+                'UPDATE scheduler_jobs SET lease_owner = NULL, lease_expires = NULL, last_finished = ?, '
+                'last_status = ?, last_error = ?, last_duration = ? WHERE name = ? AND lease_owner = ?',
+                (job.state["last_finished"], job.state["last_status"], job.state["last_error"],
+                 job.state["last_duration"], job.name, WORKER_ID)
+            )
+
+    async def _run_forever(self, job):
+        while True:
+            try:
+                if job.shared:
+                    job.state["next_run"] = await asyncio.to_thread(self._shared_next_run, job)
+                delay = max(0.0, job.state["next_run"] - time.time()) + random.uniform(0, job.jitter)
+                await asyncio.sleep(delay)
+                if job.shared:
+                    if not await asyncio.to_thread(self._acquire, job):
+                        continue
+                else:
+                    job.state["next_run"] = job.next_after(time.time())
+                if not job.shared:
+                    await self._run_once(job)
+                    continue
+                heartbeat = asyncio.create_task(self._hold_lease(job))
+                try:
+                    await self._run_once(job)
+                finally:
+                    heartbeat.cancel()
+                await asyncio.to_thread(self._release, job)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('Scheduler loop for job %s failed', job.name)
+                await asyncio.sleep(min(60, job.every or 60))
+
+    async def _run_once(self, job):
+        job.running = True
+        started = time.time()
+        job.state.update(last_started=started, last_status='running', last_error=None)
+        thread = None
+        try:
+            if asyncio.iscoroutinefunction(job.func):
+                # Async jobs are cancelled by wait_for once they overrun
+                await asyncio.wait_for(job.func(), job.max_runtime)
+            else:
+                thread = asyncio.get_running_loop().run_in_executor(None, job.func)
+                await asyncio.wait_for(asyncio.shield(thread), job.max_runtime)
+            job.state["last_status"] = 'ok'
+        except asyncio.TimeoutError:
+            job.state["last_status"] = 'timeout'
+            job.state["last_error"] = f'Exceeded max runtime of {job.max_runtime}s'
+            if thread is not None:
+                # A thread cannot be interrupted, so wait for it to return.
+                # The caller keeps renewing the lease until then, and no
+                # new run of this job starts while it is still going.
+                (outcome,) = await asyncio.gather(thread, return_exceptions=True)
+                if isinstance(outcome, Exception):
+                    logger.error('Scheduled job %s failed after timing out', job.name, exc_info=outcome)
+        except Exception as error:
+            job.state["last_status"] = 'error'
+            job.state["last_error"] = repr(error)
+            logger.exception('Scheduled job %s failed', job.name)
+        finally:
+            job.running = False
+            job.state["last_finished"] = time.time()
+            job.state["last_duration"] = job.state["last_finished"] - started
+
+    def status(self):
+        conn = get_connection()
+        try:
+            shared = {row[0]: dict(zip(
+                ('next_run', 'lease_owner', 'last_started', 'last_finished',
+                 'last_status', 'last_error', 'last_duration'), row[1:]
+            )) for row in conn.execute(
+                'SELECT name, next_run, lease_owner, last_started, last_finished, '
+                'last_status, last_error, last_duration FROM scheduler_jobs'
+            )}
+        finally:
+            conn.close()
+        jobs = []
+        for job in self.jobs.values():
+            info = {"name": job.name, "schedule": job.schedule, "shared": job.shared,
+                    "jitter": job.jitter, "max_runtime": job.max_runtime, "running_here": job.running}
+            info.update(shared.get(job.name, {}) if job.shared else job.state)
+            jobs.append(info)
+        return {"worker": WORKER_ID, "jobs": jobs}
+
+def optimize_database():
+    # PRAGMA optimize may run ANALYZE, so it is a write like any other.
+    with writer_slot():
+        conn = get_connection()
+        try:
+            conn.execute('PRAGMA optimize')
+        finally:
+            conn.close()
+
+def analyze_database():
+    with write_transaction() as conn:
+        conn.execute('ANALYZE')
+
+def vacuum_database():
+    # VACUUM cannot run inside a transaction, so hold the writer slot directly.
+    with writer_slot():
+        conn = get_connection()
+        try:
+            conn.execute('VACUUM')
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        finally:
+            conn.close()
+
+def evict_expired_cache_entries():
+    return sum(cache.evict_expired() for cache in _caches.values())
+
+def warm_recent_report():
+    start, end = parse_range(None, None, 30)
+    report_cache.get((start, end), lambda: crop_report(start, end))
+
+with write_transaction() as conn:
+    setup_scheduler(conn)
+
+scheduler = Scheduler()
+scheduler.add_job('optimize', optimize_database, every=3600, jitter=60, max_runtime=60)
+scheduler.add_job('analyze', analyze_database, cron='15 2 * * *', jitter=120, max_runtime=600)
+scheduler.add_job('vacuum', vacuum_database, cron='30 3 * * 0', jitter=120, max_runtime=1800)
+scheduler.add_job('archive-partitions', lambda: archive_old_partitions(ARCHIVE_AFTER_MONTHS),
+                  cron='0 1 * * *', jitter=120, max_runtime=1800)
+scheduler.add_job('entries-snapshot', write_entries_snapshot, every=3600, jitter=300, max_runtime=900)
+scheduler.add_job('report-rollup', warm_recent_report, every=60, jitter=10, max_runtime=30, shared=False)
+scheduler.add_job('cache-eviction', evict_expired_cache_entries, every=60, jitter=10, max_runtime=10, shared=False)
+
+@asynccontextmanager
+async def lifespan(app):
+    await scheduler.start()
+    yield
+    await scheduler.stop()
+    if _photo_pool is not None:
+        discard_photo_pool(_photo_pool, wait=True)
+
+app = FastAPI(lifespan=lifespan)
 templates = Jinja2Templates(directory="templates")
 
 # --- Security Functions ---
@@ -63,6 +1035,10 @@ async def home(request: Request):
                 align-items: center;
                 z-index: 1000;
             }
+            /* Messages must show above the data entry form that raised them */
+            #modal {
+                z-index: 1001;
+            }
             .modal-content {
                 background-color: white;
                 padding: 2rem;
@@ -634,23 +1610,18 @@ async def home(request: Request):
             });
 
             // --- Existing App Logic (Now called only after login) ---
-            const sampleReports = [
-                { crop: 'Wheat', carbonSequestration: 2.5, timestamp: '2025-09-01' },
-                { crop: 'Rice', carbonSequestration: 3.1, timestamp: '2025-08-28' },
-                { crop: 'Sugarcane', carbonSequestration: 5.8, timestamp: '2025-08-25' },
-                { crop: 'Lentils', carbonSequestration: 1.2, timestamp: '2025-08-20' },
-                { crop: 'Cotton', carbonSequestration: 4.0, timestamp: '2025-08-15' },
-            ];
-
-            function renderReports() {
+            async function renderReports() {
                 reportsList.innerHTML = '';
-                sampleReports.forEach(report => {
+                const response = await fetch('/entries?days=30');
+                const data = await response.json();
+                (data.entries || []).slice().reverse().forEach(report => {
                     const reportItem = document.createElement('div');
                     reportItem.className = 'bg-gray-50 p-4 rounded-lg shadow text-left';
                     reportItem.innerHTML = `
-                        <p class="text-gray-800 font-semibold">Crop: ${report.crop}</p>
-                        <p class="text-gray-600">Carbon Sequestration: <span class="text-green-600 font-medium">${report.carbonSequestration} tons</span></p>
-                        <p class="text-gray-400 text-sm mt-1">Date: ${report.timestamp}</p>
+                        <p class="text-gray-800 font-semibold">Crop: ${report.crop_name}</p>
+                        <p class="text-gray-600">Saplings: <span class="text-green-600 font-medium">${report.sapling_count}</span></p>
+                        <p class="text-gray-600">Carbon Sequestration: <span class="text-green-600 font-medium">${report.carbon_sequestration ?? 0} tons</span></p>
+                        <p class="text-gray-400 text-sm mt-1">Date: ${report.entry_date}</p>
                     `;
                     reportsList.appendChild(reportItem);
                 });
@@ -660,8 +1631,8 @@ async def home(request: Request):
                 dataEntryModal.style.display = 'flex';
             });
 
-            viewReportsBtn.addEventListener('click', () => {
-                renderReports();
+            viewReportsBtn.addEventListener('click', async () => {
+                await renderReports();
                 reportsModal.style.display = 'flex';
             });
 
@@ -719,15 +1690,36 @@ async def home(request: Request):
                 document.querySelectorAll('.status-icon').forEach(icon => icon.textContent = '⏳');
             });
 
-            dataEntryForm.addEventListener('submit', (event) => {
+            dataEntryForm.addEventListener('submit', async (event) => {
                 event.preventDefault();
                 const cropName = cropNameInput.value;
                 const saplingCount = saplingCountInput.value;
                 if (cropName && saplingCount) {
-                    console.log('New data entry:', { cropName, saplingCount });
-                    hideModal(dataEntryModal);
-                    showModal('modalDataSuccess');
-                    dataEntryForm.reset();
+                    let message = 'An error occurred. Please try again.';
+                    try {
+                        const response = await fetch('/entries', {
+                            method: 'POST',
+                            headers: {
+                                'Content-Type': 'application/x-www-form-urlencoded',
+                            },
+                            body: `crop_name=${encodeURIComponent(cropName)}&sapling_count=${encodeURIComponent(saplingCount)}`
+                        });
+                        const data = await response.json();
+                        if (data.success) {
+                            hideModal(dataEntryModal);
+                            showModal('modalDataSuccess');
+                            dataEntryForm.reset();
+                            return;
+                        }
+                        if (data.message) {
+                            message = data.message;
+                        }
+                    } catch (error) {
+                        // Network failure or a non-JSON response; keep the generic message
+                    }
+                    // Keep the form open so the entry can be corrected and resent
+                    modalMessage.textContent = message;
+                    modal.style.display = 'flex';
                 } else {
                     showModal('modalFillFields');
                 }
@@ -746,29 +1738,153 @@ async def home(request: Request):
     """
     return HTMLResponse(content=html_content)
 
+def create_user(username, hashed_password):
+    with write_transaction() as conn:
+        conn.execute("INSERT INTO users (username, password) VALUES (?, ?)", (username, hashed_password))
+        user_cache.invalidate(conn)
+
+# Handlers run blocking database work in a thread: waiting for the writer
+# slot must not stall the event loop of the whole worker.
 @app.post("/signup")
 async def signup(username: str = Form(...), password: str = Form(...)):
-    conn = sqlite3.connect('users.db')
-    cursor = conn.cursor()
     try:
         hashed_password = hash_password(password)
-        cursor.execute("INSERT INTO users (username, password) VALUES (?, ?)", (username, hashed_password))
-        conn.commit()
+        await asyncio.to_thread(create_user, username, hashed_password)
         return {"success": True, "message": "Sign up successful! You can now log in."}
     except sqlite3.IntegrityError:
         return {"success": False, "message": "Username already exists."}
-    finally:
-        conn.close()
 
-@app.post("/login")
-async def login(username: str = Form(...), password: str = Form(...)):
-    conn = sqlite3.connect('users.db')
+def load_user(username):
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("SELECT password FROM users WHERE username = ?", (username,))
     user = cursor.fetchone()
     conn.close()
+    return user
+
+@app.post("/login")
+async def login(username: str = Form(...), password: str = Form(...)):
+    user = await asyncio.to_thread(user_cache.get, username, lambda: load_user(username))
 
     if user and check_password(user[0], password):
         return {"success": True, "message": "Login successful!"}
     else:
         return {"success": False, "message": "Invalid username or password."}
+
+MAX_RANGE_DAYS = 366 * 100
+
+def parse_range(start, end, days):
+    end_date = date.fromisoformat(end) if end else date.today()
+    if start:
+        start_date = date.fromisoformat(start)
+    else:
+        start_date = end_date - timedelta(days=days - 1)
+    if start_date > end_date:
+        raise ValueError('start must not be after end.')
+    return start_date, end_date
+
+@app.post("/entries")
+async def create_entry(crop_name: str = Form(...), sapling_count: int = Form(...),
+                       entry_date: str = Form(None), carbon_sequestration: float = Form(None),
+                       latitude: float = Form(None), longitude: float = Form(None)):
+    try:
+        entry_id = await asyncio.to_thread(
+            insert_entry, crop_name, sapling_count,
+            entry_date=date.fromisoformat(entry_date) if entry_date else None,
+            carbon_sequestration=carbon_sequestration,
+            latitude=latitude, longitude=longitude
+        )
+    except ValueError as error:
+        return {"success": False, "message": str(error)}
+    return {"success": True, "id": entry_id}
+
+def load_entries(start_date, end_date):
+    return [dict(zip(ENTRY_COLUMNS, row)) for row in scan_entries(start_date, end_date)]
+
+@app.get("/entries")
+async def list_entries(start: str = None, end: str = None,
+                      days: int = Query(30, ge=1, le=MAX_RANGE_DAYS)):
+    try:
+        start_date, end_date = parse_range(start, end, days)
+    except (ValueError, OverflowError) as error:
+        return {"success": False, "message": str(error)}
+    entries = await asyncio.to_thread(load_entries, start_date, end_date)
+    return {"success": True, "entries": entries}
+
+@app.get("/reports")
+async def reports(start: str = None, end: str = None,
+                 days: int = Query(30, ge=1, le=MAX_RANGE_DAYS)):
+    try:
+        start_date, end_date = parse_range(start, end, days)
+    except (ValueError, OverflowError) as error:
+        return {"success": False, "message": str(error)}
+    key = (start_date, end_date)
+    report = await asyncio.to_thread(report_cache.get, key, lambda: crop_report(start_date, end_date))
+    return {"success": True, "reports": report}
+
+@app.get("/scheduler/status")
+async def scheduler_status():
+    return await asyncio.to_thread(scheduler.status)
+
+@app.post("/entries/{entry_id}/photos")
+async def upload_photos(entry_id: int, request: Request):
+    if await asyncio.to_thread(get_entry, entry_id) is None:
+        raise HTTPException(status_code=404, detail="Entry not found.")
+    content_type, options = parse_options_header(request.headers.get('content-type', ''))
+    if content_type != b'multipart/form-data' or b'boundary' not in options:
+        raise HTTPException(status_code=415, detail="Expected a multipart/form-data upload.")
+
+    stream = PhotoStream()
+    parser = MultipartParser(options[b'boundary'], stream.callbacks())
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+        parser.finalize()
+    except ValueError as error:
+        # Oversized files and malformed multipart bodies both land here
+        stream.discard()
+        raise HTTPException(status_code=413 if stream.too_large else 400, detail=str(error))
+    except BaseException:
+        stream.discard()
+        raise
+    # finalize() accepts a body that stops before the closing boundary,
+    # leaving the last part open and possibly cut short.
+    if not stream.complete:
+        stream.discard()
+        raise HTTPException(status_code=400, detail="The upload was truncated.")
+
+    # The same file attached twice in one request is only processed once
+    unique = {}
+    for staged in stream.files:
+        first = unique.setdefault(staged["hash"].hexdigest(), staged)
+        if first is not staged:
+            os.remove(staged["staged_path"])
+    try:
+        results = dict(zip(unique, await asyncio.gather(
+            *(store_photo(entry_id, staged) for staged in unique.values()), return_exceptions=True
+        )))
+    except BaseException:
+        # Client went away or the worker is shutting down
+        stream.discard()
+        raise
+    uploaded = []
+    for staged in stream.files:
+        content_hash = staged["hash"].hexdigest()
+        result = results[content_hash]
+        if isinstance(result, Exception):
+            if os.path.exists(staged["staged_path"]):
+                os.remove(staged["staged_path"])
+            if isinstance(result, photos.UnreadableImage):
+                uploaded.append({"filename": staged["filename"], "error": "Not a readable image."})
+                continue
+            if unique[content_hash] is staged:
+                logger.error('Could not store photo %s for entry %s', staged["filename"], entry_id,
+                             exc_info=result)
+            uploaded.append({"filename": staged["filename"], "error": "Could not store the photo."})
+        elif unique[content_hash] is staged:
+            uploaded.append(result)
+        else:
+            uploaded.append({**result, "filename": staged["filename"], "duplicate": True})
+    if not uploaded:
+        return {"success": False, "message": "No photos in the upload.", "photos": []}
+    return {"success": any("error" not in photo for photo in uploaded), "photos": uploaded}
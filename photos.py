@@ -0,0 +1,77 @@
+"""Photo processing that runs inside the upload process pool.
+
+Kept apart from mrv_system, and free of import-time side effects, so
+pool processes started with spawn or forkserver only import Pillow and
+this module, never the app, its database setup or its migrations.
+"""
+import math
+import os
+from datetime import datetime
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+THUMBNAIL_SIZE = (320, 320)
+
+class UnreadableImage(ValueError):
+    """The upload is not an image Pillow can decode."""
+
+def _gps_degrees(values, ref):
+    try:
+        degrees, minutes, seconds = (float(value) for value in values)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+    result = degrees + minutes / 60 + seconds / 3600
+    if math.isnan(result) or result > 180:
+        return None
+    return -result if ref in ('S', 'W') else result
+
+def _exif_datetime(value):
+    # Cameras with an unset clock write "0000:00:00 00:00:00"
+    try:
+        return datetime.strptime(value.strip('\0 '), '%Y:%m:%d %H:%M:%S').isoformat()
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+def photo_metadata(image):
+    """Return (taken_at, latitude, longitude) from EXIF, None where unusable.
+
+    Metadata is best effort: a broken field never rejects the photo.
+    """
+    try:
+        exif = image.getexif()
+        gps = exif.get_ifd(0x8825)
+        taken_at = exif.get_ifd(0x8769).get(36867) or exif.get(306)
+    except Exception:
+        # Pillow parses EXIF lazily and malformed blocks fail in many ways
+        return None, None, None
+    latitude = longitude = None
+    if 2 in gps and 4 in gps:
+        latitude = _gps_degrees(gps[2], gps.get(1))
+        longitude = _gps_degrees(gps[4], gps.get(3))
+        if latitude is None or longitude is None or abs(latitude) > 90:
+            latitude = longitude = None
+    return _exif_datetime(taken_at), latitude, longitude
+
+def process_photo(staged_path, photo_dir, content_hash):
+    """Read EXIF metadata, write a thumbnail and move the photo into photo_dir.
+
+    Raises UnreadableImage if the file cannot be decoded; other errors
+    (e.g. a full disk) propagate as is.
+    """
+    relative_dir = content_hash[:2]
+    try:
+        with Image.open(staged_path) as image:
+            taken_at, latitude, longitude = photo_metadata(image)
+            extension = '.' + (image.format or 'bin').lower()
+            thumbnail = ImageOps.exif_transpose(image)
+            thumbnail.thumbnail(THUMBNAIL_SIZE)
+            thumbnail = thumbnail.convert('RGB')
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as error:
+        raise UnreadableImage(str(error)) from error
+    thumbnail_path = os.path.join(relative_dir, content_hash + '_thumb.jpg')
+    os.makedirs(os.path.join(photo_dir, relative_dir), exist_ok=True)
+    thumbnail.save(os.path.join(photo_dir, thumbnail_path), 'JPEG', quality=85)
+    path = os.path.join(relative_dir, content_hash + extension)
+    os.replace(staged_path, os.path.join(photo_dir, path))
+    return {"taken_at": taken_at, "latitude": latitude, "longitude": longitude,
+            "path": path, "thumbnail_path": thumbnail_path}
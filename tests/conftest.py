@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+
+# mrv_system sets up its database at import time, so point it at a
+# throwaway directory before any test imports it.
+os.environ.setdefault('AGRICONNECT_DB', os.path.join(tempfile.mkdtemp(prefix='agriconnect-tests-'), 'users.db'))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,124 @@
+import math
+import os
+import struct
+from array import array
+
+import pytest
+
+import columnar
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / 'entries.agcol')
+    columnar.write_snapshot(path, [
+        ('id', array('q', [1, 2, 3])),
+        ('crop_name', array('i', [0, 1, 0])),
+        ('carbon_sequestration', array('d', [2.5, float('nan'), 1.0])),
+    ], {'crop_name': ['Wheat', 'Rice']})
+
+    with columnar.Snapshot(path) as snapshot:
+        assert snapshot.rows == 3
+        assert snapshot.column_names == ['id', 'crop_name', 'carbon_sequestration']
+        ids = snapshot.column('id')
+        assert list(ids) == [1, 2, 3]
+        ids.release()
+        carbon = snapshot.column('carbon_sequestration')
+        assert carbon[0] == 2.5 and math.isnan(carbon[1])
+        carbon.release()
+        assert columnar.sum_by(snapshot, 'crop_name', 'carbon_sequestration') == {'Wheat': 3.5, 'Rice': 0}
+        assert columnar.sum_by(snapshot, 'crop_name', 'id') == {'Wheat': 4, 'Rice': 2}
+
+
+def test_columns_are_aligned(tmp_path):
+    path = str(tmp_path / 'odd.agcol')
+    # Three int32 values leave the next column off an 8-byte boundary unless padded
+    columnar.write_snapshot(path, [('a', array('i', [1, 2, 3])), ('b', array('d', [0.5] * 3))])
+    with columnar.Snapshot(path) as snapshot:
+        b = snapshot.column('b')
+        assert list(b) == [0.5] * 3
+        b.release()
+
+
+def test_empty_snapshot(tmp_path):
+    path = str(tmp_path / 'empty.agcol')
+    columnar.write_snapshot(path, [
+        ('crop_name', array('i')),
+        ('carbon_sequestration', array('d')),
+    ], {'crop_name': []})
+    with columnar.Snapshot(path) as snapshot:
+        assert snapshot.rows == 0
+        column = snapshot.column('carbon_sequestration')
+        assert len(column) == 0
+        column.release()
+        assert columnar.sum_by(snapshot, 'crop_name', 'carbon_sequestration') == {}
+
+
+def test_snapshot_without_columns(tmp_path):
+    path = str(tmp_path / 'none.agcol')
+    columnar.write_snapshot(path, [])
+    with columnar.Snapshot(path) as snapshot:
+        assert snapshot.rows == 0
+        assert snapshot.column_names == []
+
+
+def test_rejects_ragged_columns(tmp_path):
+    with pytest.raises(ValueError):
+        columnar.write_snapshot(str(tmp_path / 'bad.agcol'), [('a', array('q', [1])), ('b', array('q', []))])
+    assert os.listdir(tmp_path) == []
+
+
+def test_rejects_foreign_files(tmp_path):
+    path = tmp_path / 'not-a-snapshot'
+    path.write_bytes(b'SQLite format 3\0' + b'\0' * 64)
+    with pytest.raises(ValueError):
+        columnar.Snapshot(str(path))
+
+
+
+def damaged_copies(tmp_path):
+    path = tmp_path / 'entries.agcol'
+    columnar.write_snapshot(str(path), [('v', array('q', range(100)))])
+    data = path.read_bytes()
+    header_end = len(columnar.MAGIC) + 8 + struct.unpack_from('<Q', data, len(columnar.MAGIC))[0]
+    for name, content in [('empty', b''), ('short', data[:len(columnar.MAGIC) + 4]),
+                          ('cut-header', data[:header_end - 10]), ('cut-data', data[:header_end + 16])]:
+        damaged = tmp_path / name
+        damaged.write_bytes(content)
+        yield damaged
+
+
+def test_rejects_damaged_files_and_closes_them(tmp_path, monkeypatch):
+    opened = []
+
+    def tracking_open(*args, **kwargs):
+        opened.append(open(*args, **kwargs))
+        return opened[-1]
+
+    monkeypatch.setattr(columnar, 'open', tracking_open, raising=False)
+    for path in damaged_copies(tmp_path):
+        with pytest.raises(ValueError):
+            columnar.Snapshot(str(path))
+    assert len(opened) == 4
+    assert all(handle.closed for handle in opened)
+
+
+def test_overlapping_writers_do_not_share_a_temp_file(tmp_path, monkeypatch):
+    path = str(tmp_path / 'entries.agcol')
+    real_replace = os.replace
+    overlapped = []
+
+    def replace(src, dst):
+        # Start a second snapshot while the first is about to be published
+        if not overlapped:
+            overlapped.append(src)
+            columnar.write_snapshot(path, [('v', array('q', [2] * 1000))])
+        real_replace(src, dst)
+
+    monkeypatch.setattr(columnar.os, 'replace', replace)
+    columnar.write_snapshot(path, [('v', array('q', [1] * 1000))])
+
+    with columnar.Snapshot(path) as snapshot:
+        values = snapshot.column('v')
+        assert set(values) == {1}
+        values.release()
+    assert os.listdir(tmp_path) == ['entries.agcol']
@@ -0,0 +1,186 @@
+import os
+from datetime import date
+
+import pytest
+
+import mrv_system
+from mrv_system import (archive_partition, get_entry, insert_entry, parse_range,
+                        partition_name, scan_entries, write_transaction)
+
+# The database is shared by the whole test session, so every test writes
+# to its own months and crop names.
+
+
+def partition(month):
+    conn = mrv_system.get_connection()
+    try:
+        return conn.execute(
+            'SELECT name, archive_file FROM entry_partitions WHERE month = ?', (month,)
+        ).fetchone()
+    finally:
+        conn.close()
+
+
+def crops(start, end):
+    return [(entry_date, crop_name) for entry_date, crop_name in
+            scan_entries(start, end, ('entry_date', 'crop_name'))]
+
+
+def test_insert_creates_partition_for_new_month():
+    assert partition('2001-03') is None
+    entry_id = insert_entry('Teak', 5, entry_date=date(2001, 3, 14))
+    assert partition('2001-03') == ('entries_200103', None)
+    entry = get_entry(entry_id)
+    assert entry['crop_name'] == 'Teak' and entry['entry_date'] == '2001-03-14'
+    insert_entry('Teak', 2, entry_date=date(2001, 3, 1))
+    assert partition('2001-03') == ('entries_200103', None)
+
+
+def test_scan_reads_only_months_in_range():
+    insert_entry('Mango', 1, entry_date=date(2002, 1, 31))
+    insert_entry('Guava', 1, entry_date=date(2002, 2, 1))
+    insert_entry('Banana', 1, entry_date=date(2002, 2, 15))
+    insert_entry('Cashew', 1, entry_date=date(2002, 3, 1))
+
+    assert crops(date(2002, 2, 1), date(2002, 2, 28)) == [
+        ('2002-02-01', 'Guava'), ('2002-02-15', 'Banana'),
+    ]
+    assert crops(date(2002, 1, 31), date(2002, 3, 1)) == [
+        ('2002-01-31', 'Mango'), ('2002-02-01', 'Guava'),
+        ('2002-02-15', 'Banana'), ('2002-03-01', 'Cashew'),
+    ]
+
+
+def test_scan_prunes_partitions_outside_range(monkeypatch):
+    insert_entry('Neem', 1, entry_date=date(2003, 5, 10))
+    insert_entry('Neem', 1, entry_date=date(2003, 7, 10))
+    opened = []
+    real_connection = mrv_system.get_connection
+
+    class Tracing:
+        def __init__(self, conn):
+            self.conn = conn
+
+        def execute(self, sql, *args):
+            opened.extend(name for name in ('entries_200305', 'entries_200307') if name in sql)
+            return self.conn.execute(sql, *args)
+
+        def close(self):
+            self.conn.close()
+
+    monkeypatch.setattr(mrv_system, 'get_connection', lambda: Tracing(real_connection()))
+    assert crops(date(2003, 7, 1), date(2003, 7, 31)) == [('2003-07-10', 'Neem')]
+    assert opened == ['entries_200307']
+
+
+def test_archive_moves_month_to_its_own_file():
+    first = insert_entry('Sal', 3, entry_date=date(2004, 6, 2))
+    insert_entry('Sal', 4, entry_date=date(2004, 6, 20))
+    insert_entry('Sal', 9, entry_date=date(2004, 7, 1))
+
+    assert archive_partition('2004-06')
+    assert partition('2004-06') == ('entries_200406', 'entries_200406.db')
+    assert os.path.exists(os.path.join(mrv_system.ARCHIVE_DIR, 'entries_200406.db'))
+    conn = mrv_system.get_connection()
+    try:
+        live = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'entries_200406'"
+        ).fetchone()
+    finally:
+        conn.close()
+    assert live is None
+
+    assert crops(date(2004, 6, 1), date(2004, 7, 31)) == [
+        ('2004-06-02', 'Sal'), ('2004-06-20', 'Sal'), ('2004-07-01', 'Sal'),
+    ]
+    assert get_entry(first)['sapling_count'] == 3
+    assert mrv_system.crop_report(date(2004, 6, 1), date(2004, 6, 30))[0]['total_saplings'] == 7
+    assert not archive_partition('2004-06')
+    with pytest.raises(ValueError):
+        insert_entry('Sal', 1, entry_date=date(2004, 6, 5))
+
+
+def test_archive_gives_up_when_month_changes_while_copying(monkeypatch):
+    insert_entry('Acacia', 1, entry_date=date(2005, 8, 1))
+    real_compact = mrv_system.compact_archive
+
+    def compact_then_insert(archive_file):
+        real_compact(archive_file)
+        insert_entry('Acacia', 2, entry_date=date(2005, 8, 9))
+
+    monkeypatch.setattr(mrv_system, 'compact_archive', compact_then_insert)
+    assert not archive_partition('2005-08')
+    assert partition('2005-08') == ('entries_200508', None)
+    assert not os.path.exists(os.path.join(mrv_system.ARCHIVE_DIR, 'entries_200508.db'))
+    assert not [name for name in os.listdir(mrv_system.ARCHIVE_DIR) if name.endswith('.tmp')]
+
+    monkeypatch.setattr(mrv_system, 'compact_archive', real_compact)
+    assert archive_partition('2005-08')
+    assert crops(date(2005, 8, 1), date(2005, 8, 31)) == [('2005-08-01', 'Acacia'), ('2005-08-09', 'Acacia')]
+
+
+def test_migrate_farm_data_keeps_ids_and_falls_back_on_dates():
+    taken = insert_entry('Existing', 1, entry_date=date(2006, 1, 1))
+    free = taken + 1000
+    with write_transaction() as conn:
+        conn.execute('''
+            CREATE TABLE farm_data (
+                id INTEGER PRIMARY KEY,
+                user_id INTEGER,
+                crop_name TEXT NOT NULL,
+                area_hectares REAL,
+                planting_date DATE,
+                sapling_count INTEGER,
+                carbon_sequestration REAL,
+                latitude REAL,
+                longitude REAL,
+                verification_status TEXT DEFAULT 'pending',
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.executemany(
+            'INSERT INTO farm_data (id, crop_name, planting_date, sapling_count, created_at) '
+            'VALUES (?, ?, ?, ?, ?)', [
+                (free, 'Planted', '2006-02-03', 4, '2006-05-05 10:00:00'),
+                (taken, 'Clashing', '2006-02-04', None, '2006-05-05 10:00:00'),
+                (free + 1, 'NoPlanting', 'unknown', 2, '2006-04-09 08:30:00'),
+                (free + 2, 'NoDates', None, 1, 'garbage'),
+            ]
+        )
+        mrv_system.migrate_farm_data(conn)
+        tables = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        conn.execute('DROP TABLE farm_data_legacy')
+
+    assert 'farm_data' not in tables and 'farm_data_legacy' in tables
+    planted = get_entry(free)
+    assert planted['crop_name'] == 'Planted' and planted['entry_date'] == '2006-02-03'
+    assert planted['created_at'] == '2006-05-05 10:00:00'
+    assert get_entry(taken)['crop_name'] == 'Existing'
+    assert ('2006-02-04', 'Clashing') in crops(date(2006, 2, 1), date(2006, 2, 28))
+    assert get_entry(free + 1)['entry_date'] == '2006-04-09'
+    assert get_entry(free + 2)['entry_date'] == date.today().isoformat()
+
+
+def test_migrate_farm_data_without_legacy_table_is_a_no_op():
+    with write_transaction() as conn:
+        mrv_system.migrate_farm_data(conn)
+
+
+def test_parse_range_defaults_to_trailing_days():
+    assert parse_range(None, '2024-03-10', 10) == (date(2024, 3, 1), date(2024, 3, 10))
+    assert parse_range('2024-01-01', '2024-03-10', 10) == (date(2024, 1, 1), date(2024, 3, 10))
+    assert parse_range(None, None, 1) == (date.today(), date.today())
+
+
+@pytest.mark.parametrize('start, end, days, error', [
+    ('2024-03-11', '2024-03-10', 1, ValueError),
+    ('not-a-date', None, 1, ValueError),
+    (None, '0001-01-05', 30, OverflowError),
+])
+def test_parse_range_rejects_bad_ranges(start, end, days, error):
+    with pytest.raises(error):
+        parse_range(start, end, days)
+
+
+def test_partition_name():
+    assert partition_name('2024-09') == 'entries_202409'
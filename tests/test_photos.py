@@ -0,0 +1,113 @@
+import io
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+import mrv_system
+import photos
+
+
+def jpeg(exif_tags=None, gps_tags=None, color=(10, 200, 30)):
+    exif = Image.Exif()
+    for tag, value in (exif_tags or {}).items():
+        exif[tag] = value
+    if gps_tags:
+        gps = exif.get_ifd(0x8825)
+        gps.update(gps_tags)
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 48), color).save(buffer, 'JPEG', exif=exif)
+    return buffer.getvalue()
+
+
+def metadata(data):
+    with Image.open(io.BytesIO(data)) as image:
+        return photos.photo_metadata(image)
+
+
+def test_metadata_reads_gps_and_capture_time():
+    data = jpeg({306: '2025:09:01 10:20:30'},
+                {1: 'S', 2: (18.0, 31.0, 12.0), 3: 'E', 4: (73.0, 51.0, 0.0)})
+    assert metadata(data) == ('2025-09-01T10:20:30', -18.52, 73.85)
+
+
+@pytest.mark.parametrize('exif_tags, gps_tags', [
+    ({306: '0000:00:00 00:00:00'}, None),
+    ({306: 'not a date'}, None),
+    (None, {1: 'N', 2: (18.0, 31.0), 3: 'E', 4: (73.0, 51.0, 0.0)}),
+    (None, {1: 'N', 2: (95.0, 0.0, 0.0), 3: 'E', 4: (73.0, 51.0, 0.0)}),
+])
+def test_unusable_metadata_becomes_none(exif_tags, gps_tags):
+    assert metadata(jpeg(exif_tags, gps_tags)) == (None, None, None)
+
+
+@pytest.fixture
+def client():
+    with TestClient(mrv_system.app) as client:
+        yield client
+
+
+def upload(client, entry_id, *files):
+    return client.post(f'/entries/{entry_id}/photos',
+                       files=[('photos', (name, data, 'application/octet-stream')) for name, data in files])
+
+
+def test_photo_with_unset_camera_clock_is_accepted(client):
+    entry_id = client.post('/entries', data={'crop_name': 'Wheat', 'sapling_count': 3}).json()['id']
+    response = upload(client, entry_id, ('clock.jpg', jpeg({306: '0000:00:00 00:00:00'}, color=(1, 2, 3))))
+    photo, = response.json()['photos']
+    assert 'error' not in photo
+    assert photo['taken_at'] is None
+
+
+def test_upload_reports_each_file(client):
+    entry_id = client.post('/entries', data={'crop_name': 'Rice', 'sapling_count': 2}).json()['id']
+    photo = jpeg(color=(4, 5, 6))
+    response = upload(client, entry_id, ('a.jpg', photo), ('notes.txt', b'hello'), ('a-again.jpg', photo))
+    body = response.json()
+    assert body['success'] is True
+    first, text, again = body['photos']
+    assert first['duplicate'] is False
+    assert text == {'filename': 'notes.txt', 'error': 'Not a readable image.'}
+    assert again['duplicate'] is True and again['content_hash'] == first['content_hash']
+
+
+def test_upload_fails_when_no_file_is_stored(client):
+    entry_id = client.post('/entries', data={'crop_name': 'Rice', 'sapling_count': 2}).json()['id']
+    body = upload(client, entry_id, ('notes.txt', b'hello')).json()
+    assert body['success'] is False
+
+
+def test_storage_errors_are_logged_not_reported_as_unreadable(client, monkeypatch, caplog):
+    entry_id = client.post('/entries', data={'crop_name': 'Rice', 'sapling_count': 2}).json()['id']
+
+    def disk_full(entry_id, photo):
+        raise OSError(28, 'No space left on device')
+
+    monkeypatch.setattr(mrv_system, 'save_photo', disk_full)
+    body = upload(client, entry_id, ('full.jpg', jpeg(color=(7, 8, 9)))).json()
+    assert body == {'success': False, 'photos': [{'filename': 'full.jpg', 'error': 'Could not store the photo.'}]}
+    assert 'Could not store photo full.jpg' in caplog.text
+
+
+def test_truncated_upload_is_rejected_and_cleaned_up(client):
+    entry_id = client.post('/entries', data={'crop_name': 'Rice', 'sapling_count': 2}).json()['id']
+    body = (b'--xyz\r\n'
+            b'Content-Disposition: form-data; name="photos"; filename="cut.jpg"\r\n'
+            b'Content-Type: image/jpeg\r\n\r\n' + jpeg(color=(11, 12, 13))[:300])
+    response = client.post(f'/entries/{entry_id}/photos', content=body,
+                           headers={'content-type': 'multipart/form-data; boundary=xyz'})
+    assert response.status_code == 400
+    assert os.listdir(mrv_system.PHOTO_STAGING_DIR) == []
+
+
+def test_pool_processes_do_not_import_the_app():
+    pool = mrv_system.get_photo_pool()
+    try:
+        imported = pool.submit(eval, "'mrv_system' in __import__('sys').modules").result(timeout=60)
+        start_method = pool.submit(eval, "__import__('multiprocessing').get_start_method()").result(timeout=60)
+    finally:
+        mrv_system.discard_photo_pool(pool, wait=True)
+    assert imported is False
+    assert start_method == 'spawn'
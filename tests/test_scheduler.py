@@ -0,0 +1,182 @@
+import asyncio
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+import mrv_system
+from mrv_system import CronSchedule, Scheduler
+
+
+def next_run(expression, after):
+    return datetime.fromtimestamp(CronSchedule(expression).next_after(after.timestamp()))
+
+
+def test_cron_crosses_month_boundary():
+    assert next_run('0 0 1 * *', datetime(2025, 1, 31, 23, 59)) == datetime(2025, 2, 1, 0, 0)
+    assert next_run('0 12 31 * *', datetime(2025, 4, 1)) == datetime(2025, 5, 31, 12, 0)
+
+
+def test_cron_crosses_year_boundary():
+    assert next_run('30 3 * * *', datetime(2025, 12, 31, 23, 0)) == datetime(2026, 1, 1, 3, 30)
+    assert next_run('0 0 29 2 *', datetime(2025, 3, 1)) == datetime(2028, 2, 29, 0, 0)
+
+
+def test_cron_weekdays():
+    # 2025-12-31 is a Wednesday; the next Monday is in the new year
+    assert next_run('0 9 * * 1', datetime(2025, 12, 31, 10, 0)) == datetime(2026, 1, 5, 9, 0)
+    # Sunday can be written as 0 or 7
+    sunday = datetime(2025, 10, 19, 0, 0)
+    assert next_run('0 0 * * 0', datetime(2025, 10, 15)) == sunday
+    assert next_run('0 0 * * 7', datetime(2025, 10, 15)) == sunday
+    # A restricted day-of-month and day-of-week match either, as in cron
+    assert next_run('0 0 13 * 5', datetime(2025, 6, 1)) == datetime(2025, 6, 6, 0, 0)
+
+
+def test_cron_is_strictly_after():
+    assert next_run('*/15 * * * *', datetime(2025, 1, 1, 10, 7, 30)) == datetime(2025, 1, 1, 10, 15)
+    assert next_run('*/15 * * * *', datetime(2025, 1, 1, 10, 15)) == datetime(2025, 1, 1, 10, 30)
+    assert next_run('0-30/10 8 * * *', datetime(2025, 1, 1, 8, 30)) == datetime(2025, 1, 2, 8, 0)
+
+
+@pytest.mark.parametrize('expression', ['* * * *', '60 * * * *', '* 24 * * *', '0 0 0 * *', '5-1 * * * *'])
+def test_cron_rejects_invalid_expressions(expression):
+    with pytest.raises(ValueError):
+        CronSchedule(expression)
+
+
+def set_next_run(name, when):
+    with mrv_system.write_transaction() as conn:
+        conn.execute('UPDATE scheduler_jobs SET next_run = ? WHERE name = ?', (when, name))
+
+
+def lease_of(name):
+    conn = mrv_system.get_connection()
+    try:
+        return conn.execute(
+            'SELECT lease_owner, lease_expires FROM scheduler_jobs WHERE name = ?', (name,)
+        ).fetchone()
+    finally:
+        conn.close()
+
+
+def test_lease_acquire_and_release():
+    scheduler = Scheduler()
+    scheduler.add_job('lease-basics', lambda: None, every=3600)
+    job = scheduler.jobs['lease-basics']
+    scheduler._register_shared(job)
+
+    assert not scheduler._acquire(job)  # not due yet
+    set_next_run('lease-basics', time.time() - 1)
+    assert scheduler._acquire(job)
+    assert lease_of('lease-basics')[0] == mrv_system.WORKER_ID
+    assert not scheduler._acquire(job)  # already leased
+
+    job.state.update(last_finished=time.time(), last_status='ok', last_duration=0.0)
+    scheduler._release(job)
+    assert lease_of('lease-basics') == (None, None)
+    assert not scheduler._acquire(job)  # next run was pushed an hour out
+
+
+class Tracker:
+    def __init__(self, duration):
+        self.duration = duration
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+        self.runs = 0
+
+    def __call__(self):
+        with self.lock:
+            self.active += 1
+            self.runs += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.duration)
+        with self.lock:
+            self.active -= 1
+
+
+def test_lease_is_held_until_a_timed_out_thread_returns(monkeypatch):
+    monkeypatch.setattr(mrv_system, 'LEASE_SECONDS', 0.3)
+    tracker = Tracker(duration=1.0)
+    # Two schedulers stand in for two workers competing for the same job
+    schedulers = [Scheduler(), Scheduler()]
+    for scheduler in schedulers:
+        scheduler.add_job('slow-shared', tracker, every=0.05, max_runtime=0.1)
+
+    async def main():
+        for scheduler in schedulers:
+            await scheduler.start()
+        await asyncio.sleep(0.7)
+        # Past max_runtime and two lease lengths, yet the lease is still held
+        owner, expires = lease_of('slow-shared')
+        held = owner is not None and expires > time.time()
+        await asyncio.sleep(1.8)
+        for scheduler in schedulers:
+            await scheduler.stop()
+        return held
+
+    assert asyncio.run(main())
+    assert tracker.runs >= 2
+    assert tracker.max_active == 1
+    statuses = [scheduler.jobs['slow-shared'].state["last_status"] for scheduler in schedulers]
+    assert 'timeout' in statuses
+
+
+def test_run_once_waits_for_a_timed_out_thread():
+    scheduler = Scheduler()
+    scheduler.add_job('slow-local', Tracker(duration=0.5), every=60, max_runtime=0.05, shared=False)
+    job = scheduler.jobs['slow-local']
+
+    async def timed_run():
+        # Timed inside the loop: asyncio.run() itself waits for the thread
+        started = time.monotonic()
+        await scheduler._run_once(job)
+        return time.monotonic() - started
+
+    assert asyncio.run(timed_run()) >= 0.5
+    assert job.state["last_status"] == 'timeout'
+    assert not job.running
+
+
+def test_timed_out_async_job_is_cancelled():
+    cancelled = []
+
+    async def hang():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    scheduler = Scheduler()
+    scheduler.add_job('hang', hang, every=60, max_runtime=0.05, shared=False)
+    asyncio.run(scheduler._run_once(scheduler.jobs['hang']))
+    assert cancelled == [True]
+    assert scheduler.jobs['hang'].state["last_status"] == 'timeout'
+
+
+def test_failed_renewal_is_logged_and_retried(monkeypatch, caplog):
+    monkeypatch.setattr(mrv_system, 'LEASE_SECONDS', 0.15)
+    scheduler = Scheduler()
+    scheduler.add_job('flaky-renew', lambda: None, every=3600)
+    job = scheduler.jobs['flaky-renew']
+    attempts = []
+
+    def renew(job):
+        attempts.append(job.name)
+        if len(attempts) == 1:
+            raise RuntimeError('disk I/O error')
+
+    monkeypatch.setattr(scheduler, '_renew', renew)
+
+    async def main():
+        heartbeat = asyncio.create_task(scheduler._hold_lease(job))
+        await asyncio.sleep(0.25)
+        heartbeat.cancel()
+        await asyncio.gather(heartbeat, return_exceptions=True)
+
+    asyncio.run(main())
+    assert len(attempts) >= 2
+    assert 'Could not renew the lease for job flaky-renew' in caplog.text
@@ -0,0 +1,145 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+import mrv_system
+from mrv_system import SharedCache, write_transaction, writer_slot
+
+
+def make_table(name, value):
+    with write_transaction() as conn:
+        conn.execute(f'CREATE TABLE IF NOT EXISTS {name} (k TEXT PRIMARY KEY, v TEXT)')
+        conn.execute(f'INSERT OR REPLACE INTO {name} VALUES (?, ?)', ('key', value))
+
+
+def read(name):
+    conn = mrv_system.get_connection()
+    try:
+        return conn.execute(f'SELECT v FROM {name} WHERE k = ?', ('key',)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def other_worker_write(name, value, namespace):
+    """Commit a change plus a generation bump from an unrelated connection."""
+    conn = sqlite3.connect(mrv_system.DB_PATH)
+    conn.execute(f'UPDATE {name} SET v = ? WHERE k = ?', (value, 'key'))
+    conn.execute(
+        'INSERT INTO cache_generations (namespace, generation) VALUES (?, 1) '
+        'ON CONFLICT(namespace) DO UPDATE SET generation = generation + 1', (namespace,)
+    )
+    conn.commit()
+    conn.close()
+
+
+def test_write_transaction_rolls_back_on_error():
+    make_table('rollback_check', 'before')
+    with pytest.raises(RuntimeError):
+        with write_transaction() as conn:
+            conn.execute('UPDATE rollback_check SET v = ?', ('after',))
+            raise RuntimeError('boom')
+    assert read('rollback_check') == 'before'
+    # The writer slot was released
+    make_table('rollback_check', 'again')
+    assert read('rollback_check') == 'again'
+
+
+def test_writer_slot_serializes_writers():
+    make_table('counter_check', '0')
+
+    def bump():
+        for _ in range(25):
+            with write_transaction() as conn:
+                (value,) = conn.execute('SELECT v FROM counter_check').fetchone()
+                conn.execute('UPDATE counter_check SET v = ?', (str(int(value) + 1),))
+
+    threads = [threading.Thread(target=bump) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert read('counter_check') == '100'
+
+
+def test_writer_slot_blocks_write_transactions():
+    make_table('slot_check', 'x')
+    entered = []
+
+    def writer():
+        with write_transaction() as conn:
+            entered.append(time.monotonic())
+            conn.execute('UPDATE slot_check SET v = ?', ('y',))
+
+    with writer_slot():
+        thread = threading.Thread(target=writer)
+        thread.start()
+        time.sleep(0.2)
+        assert entered == []
+        released = time.monotonic()
+    thread.join()
+    assert entered[0] >= released
+
+
+def test_invalidation_reaches_other_connections():
+    make_table('coherence_check', 'old')
+    cache = SharedCache('test-coherence')
+    assert cache.get('key', lambda: read('coherence_check')) == 'old'
+
+    # A commit that does not bump the namespace keeps the cached value
+    conn = sqlite3.connect(mrv_system.DB_PATH)
+    conn.execute('UPDATE coherence_check SET v = ?', ('unannounced',))
+    conn.commit()
+    conn.close()
+    assert cache.get('key', lambda: read('coherence_check')) == 'old'
+
+    other_worker_write('coherence_check', 'new', 'test-coherence')
+    assert cache.get('key', lambda: read('coherence_check')) == 'new'
+
+
+def test_stale_load_racing_another_worker_is_not_kept():
+    make_table('race_check', 'old')
+    cache = SharedCache('test-race')
+
+    def stale_loader():
+        value = read('race_check')
+        # Meanwhile another worker commits and a second thread here syncs
+        other_worker_write('race_check', 'new', 'test-race')
+        mrv_system._sync_caches()
+        return value
+
+    assert cache.get('key', stale_loader) == 'old'
+    assert cache.get('key', lambda: read('race_check')) == 'new'
+
+
+def test_stale_load_racing_a_local_invalidation_is_not_kept():
+    make_table('local_race_check', 'old')
+    cache = SharedCache('test-local-race')
+
+    def stale_loader():
+        value = read('local_race_check')
+        with write_transaction() as conn:
+            conn.execute('UPDATE local_race_check SET v = ?', ('new',))
+            cache.invalidate(conn)
+        return value
+
+    assert cache.get('key', stale_loader) == 'old'
+    assert cache.get('key', lambda: read('local_race_check')) == 'new'
+
+
+def test_load_during_an_open_write_is_cleared_on_commit():
+    make_table('window_check', 'old')
+    cache = SharedCache('test-window')
+    seen = []
+
+    with write_transaction() as conn:
+        conn.execute('UPDATE window_check SET v = ?', ('new',))
+        cache.invalidate(conn)
+        # Another thread reads before the commit is visible
+        thread = threading.Thread(target=lambda: seen.append(cache.get('key', lambda: read('window_check'))))
+        thread.start()
+        thread.join()
+
+    assert seen == ['old']
+    assert cache.get('key', lambda: read('window_check')) == 'new'